@@ -25,204 +25,33 @@ from gi.repository import Gtk
 from gi.repository import GObject
 from gi.repository import Pango
 
-import os
+import re
 import string
-import sys
 
 from samba.dcerpc import misc
 from sambagtk.dialogs import ConnectDialog
 from sambagtk.moderngtk import get_resource
+from sambagtk.regmodel import (
+    RegistryValue,
+    RegistryKey,
+    RegistryStats,
+    RegistryDiff,
+    )
 
 
-class RegistryValue(object):
-    def __init__(self, name, type, data, parent):
-        self.name = name
-        self.type = type
-        self.data = data
-        self.parent = parent
-
-    def get_absolute_path(self):
-        if self.parent is None:
-            return self.name
-        else:
-            return self.parent.get_absolute_path() + "\\" + self.name
-
-    def get_data_string(self):
-        interpreted_data = self.get_interpreted_data()
-
-        if interpreted_data is None or len(self.data) == 0:
-            return _("(value not set)")
-        elif self.type in (misc.REG_SZ, misc.REG_EXPAND_SZ):
-            return interpreted_data
-        elif self.type == misc.REG_BINARY:
-            return "".join(["%02X" % byte for byte in interpreted_data])
-        elif self.type == misc.REG_DWORD:
-            return "0x%08X" % (interpreted_data)
-        elif self.type == misc.REG_DWORD_BIG_ENDIAN:
-            return "0x%08X" % (interpreted_data)
-        elif self.type == misc.REG_MULTI_SZ:
-            return " ".join(interpreted_data)
-        elif self.type == misc.REG_QWORD:
-            return "0x%016X" % (interpreted_data)
-        else:
-            return str(interpreted_data)
-
-    def get_interpreted_data(self):
-        if self.data is None:
-            return None
-
-        if self.type in (misc.REG_SZ, misc.REG_EXPAND_SZ):
-            result = ""
-
-            index = 0
-            # The +1 ensures that the whole char is valid.
-            # Corrupt keys can otherwise cause exceptions
-            while (index + 1 < len(self.data)):
-                word = ((self.data[index + 1] << 8) + self.data[index])
-                if word != 0:
-                    result += unichr(word)
-                index += 2
-
-            return result
-        elif self.type == misc.REG_BINARY:
-            return self.data
-        elif self.type == misc.REG_DWORD:
-            result = 0L
-
-            if len(self.data) < 4:
-                return 0L
-
-            for i in xrange(4):
-                result = (result << 8) + self.data[3 - i]
-
-            return result
-        elif self.type == misc.REG_DWORD_BIG_ENDIAN:
-            result = 0L
-
-            if len(self.data) < 4:
-                return 0L
-
-            for i in xrange(4):
-                result = (result << 8) + self.data[i]
-
-            return result
-        elif self.type == misc.REG_MULTI_SZ:
-            result = []
-            string = ""
-
-            if len(self.data) == 0:
-                return []
-
-            index = 0
-            while (index < len(self.data)):
-                word = ((self.data[index + 1] << 8) + self.data[index])
-                if word == 0:
-                    result.append(string)
-                    string = ""
-                else:
-                    string += unichr(word)
-
-                index += 2
-
-            result.pop() # remove last systematic empty string
-
-            return result
-        elif self.type == misc.REG_QWORD:
-            result = 0L
-
-            if len(self.data) < 8:
-                return 0L
-
-            for i in xrange(8):
-                result = (result << 8) + self.data[7 - i]
-
-            return result
-        else:
-            return self.data
-
-    def set_interpreted_data(self, data):
-        del self.data[:]
-
-        if data is None:
-            self.data = None
-        elif self.type in (misc.REG_SZ, misc.REG_EXPAND_SZ):
-            for uch in data:
-                word = ord(uch)
-                self.data.append(int(word & 0x00FF))
-                self.data.append(int((word >> 8) & 0x00FF))
-        elif self.type == misc.REG_BINARY:
-            self.data = []
-            for elem in data:
-                self.data.append(int(elem))
-        elif self.type == misc.REG_DWORD:
-            for i in xrange(4):
-                self.data.append(int(data >> (8 * i) & 0xFF))
-        elif self.type == misc.REG_DWORD_BIG_ENDIAN:
-            for i in xrange(3, -1, -1):
-                self.data.append(int(data >> (8 * i) & 0xFF))
-        elif self.type == misc.REG_MULTI_SZ:
-            index = 0
-
-            for string in data:
-                for uch in string:
-                    word = ord(uch)
-                    self.data.append(int(word & 0x00FF))
-                    self.data.append(int((word >> 8) & 0x00FF))
-
-                self.data.append(0)
-                self.data.append(0)
-
-            self.data.append(0)
-            self.data.append(0)
-        elif self.type == misc.REG_QWORD:
-            for i in xrange(8):
-                self.data.append(int(data >> (8 * i) & 0xFF))
-        else:
-            self.data = data
-
-    def list_view_representation(self):
-        return [self.name, RegistryValue.get_type_string(self.type),
-                self.get_data_string(), self]
-
-    @staticmethod
-    def get_type_string(type):
-        type_strings = {
-            misc.REG_SZ: _("String"),
-            misc.REG_BINARY: _("Binary Data"),
-            misc.REG_EXPAND_SZ: _("Expandable String"),
-            misc.REG_DWORD: _("32-bit Number (little endian)"),
-            misc.REG_DWORD_BIG_ENDIAN: _("32-bit Number (big endian)"),
-            misc.REG_MULTI_SZ: _("Multi-String"),
-            misc.REG_QWORD: _("64-bit Number (little endian)")
-            }
-
-        return type_strings[type]
-
-
-class RegistryKey(object):
-
-    def __init__(self, name, parent):
-        self.name = name
-        self.parent = parent
-        self.handle = None
-
-    def get_absolute_path(self):
-        if self.parent is None:
-            return self.name
-        else:
-            return self.parent.get_absolute_path() + "\\" + self.name
-
-    def get_root_key(self):
-        if self.parent is None:
-            return self
-        else:
-            return self.parent.get_root_key()
+class RegValueEditDialog(Gtk.Dialog):
 
-    def list_view_representation(self):
-        return [self.name, self]
+    # How many bytes are shown on each line of the binary editor
+    binary_line_length = 8
 
+    # Bytes that aren't shown as themselves in the ascii column become '.'.
+    #   We don't just use string.printable because that includes '\n' and
+    #   '\r' which we don't want in the ascii column.
+    ascii_table = "".join([((chr(byte) in (string.punctuation + string.digits +
+                                          string.ascii_letters + " ")) and
+                            chr(byte) or ".") for byte in range(256)])
 
-class RegValueEditDialog(Gtk.Dialog):
+    non_hex_digits = re.compile("[^0-9A-Fa-f]")
 
     def __init__(self, reg_value, type):
         super(RegValueEditDialog, self).__init__()
@@ -234,11 +63,9 @@ class RegValueEditDialog(Gtk.Dialog):
             self.brand_new = False
             self.reg_value = reg_value
 
-        self.disable_signals = False
-        # Because moving the cursor in some functions has no effect,
-        # we need to keep this value and apply it at the right time
-        self.ascii_cursor_shift = 0
-        self.hex_cursor_shift = 0
+        # The data being edited on the binary page. The binary editor only
+        #   formats the lines that are on screen, straight from this.
+        self.binary_data = bytearray()
 
         self.create()
         self.reg_value_to_values()
@@ -293,36 +120,41 @@ class RegValueEditDialog(Gtk.Dialog):
         scrolledwindow = Gtk.ScrolledWindow(None, None)
         scrolledwindow.set_policy(Gtk.PolicyType.AUTOMATIC,
                                     Gtk.PolicyType.ALWAYS)
-        scrolledwindow.set_shadow_type(Gtk.ShadowType.NONE)
+        scrolledwindow.set_shadow_type(Gtk.ShadowType.IN)
         self.type_notebook.append_page(scrolledwindow,Gtk.Label(_("Binary")))
 
-        hbox = Gtk.HBox()
-        scrolledwindow.add_with_viewport(hbox)
-
-        self.binary_data_addr_text_view = Gtk.TextView()
-        self.binary_data_addr_text_view.set_wrap_mode(Gtk.WrapMode.WORD)
-        self.binary_data_addr_text_view.set_editable(False)
-        self.binary_data_addr_text_view.modify_font(Pango.FontDescription(
-                                                                    "mono 10"))
-        self.binary_data_addr_text_view.set_size_request(60, -1)
-        hbox.pack_start(self.binary_data_addr_text_view, False, False, 0)
-
-        self.binary_data_hex_text_view = Gtk.TextView()
-        self.binary_data_hex_text_view.set_wrap_mode(Gtk.WrapMode.WORD)
-        self.binary_data_hex_text_view.set_accepts_tab(False)
-        self.binary_data_hex_text_view.modify_font(Pango.FontDescription(
-                                                             "mono bold 10"))
-        self.binary_data_hex_text_view.set_size_request(275, -1)
-        hbox.pack_start(self.binary_data_hex_text_view, False, False, 0)
-
-        self.binary_data_ascii_text_view = Gtk.TextView()
-        self.binary_data_ascii_text_view.set_wrap_mode(Gtk.WrapMode.CHAR)
-        #self.binary_data_ascii_text_view.set_editable(False)
-        self.binary_data_ascii_text_view.modify_font(Pango.FontDescription(
-                                                                    "mono 10"))
-        self.binary_data_ascii_text_view.set_accepts_tab(False)
-        self.binary_data_ascii_text_view.set_size_request(100, -1)
-        hbox.pack_start(self.binary_data_ascii_text_view, False, False, 0)
+        # One row per line, holding the line number. What's shown is worked
+        #   out from self.binary_data when a row is drawn.
+        self.binary_data_store = Gtk.ListStore(GObject.TYPE_INT)
+        self.binary_data_tree_view = Gtk.TreeView(self.binary_data_store)
+        self.binary_data_tree_view.modify_font(Pango.FontDescription("mono 10"))
+        self.binary_data_tree_view.set_enable_search(False)
+        scrolledwindow.add(self.binary_data_tree_view)
+
+        # (title, width, font, editable)
+        columns = [(_("Address"), 60, "mono 10", False),
+                   (_("Hex"), 275, "mono bold 10", True),
+                   (_("ASCII"), 100, "mono 10", True)]
+        for (column_index, (title, width, font, editable)) in enumerate(
+                                                                    columns):
+            column = Gtk.TreeViewColumn()
+            column.set_title(title)
+            # Needed for fixed height mode, which saves measuring every row
+            column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+            column.set_fixed_width(width)
+            renderer = Gtk.CellRendererText()
+            renderer.set_property('font', font)
+            renderer.set_property('editable', editable)
+            column.pack_start(renderer, True)
+            column.set_cell_data_func(renderer,
+                                      self.on_binary_data_cell_data,
+                                      column_index)
+            self.binary_data_tree_view.append_column(column)
+            if (column_index == 1):
+                renderer.connect('edited', self.on_binary_data_hex_edited)
+            elif (column_index == 2):
+                renderer.connect('edited', self.on_binary_data_ascii_edited)
+        self.binary_data_tree_view.set_fixed_height_mode(True)
 
         # number type page
         hbox = Gtk.HBox()
@@ -373,25 +205,8 @@ class RegValueEditDialog(Gtk.Dialog):
         self.set_default_response(Gtk.ResponseType.OK)
 
         # signals/events
-        self.binary_data_hex_text_view.get_buffer().connect('changed',
-                        self.on_binary_data_hex_text_view_buffer_changed)
-        self.binary_data_hex_text_view.get_buffer().connect('insert-text',
-                        self.on_binary_data_hex_text_view_buffer_insert_text)
-        self.binary_data_hex_text_view.get_buffer().connect('delete-range',
-                        self.on_binary_data_hex_text_view_buffer_delete_range)
-
-        # Ascii text view callbacks. This view requires special attention to
-        # facilitate the crazy editing it needs to do
-        self.binary_data_ascii_text_view.get_buffer().connect('insert-text',
-                        # Manually handles inserting text
-                        self.on_binary_data_ascii_text_view_buffer_insert_text)
-        self.binary_data_ascii_text_view.get_buffer().connect('delete-range',
-                        # Manually handles deleting text
-                        self.on_binary_data_ascii_text_view_buffer_delete_range)
-        self.binary_data_ascii_text_view.get_buffer().connect('changed',
-                        self.on_binary_data_ascii_text_view_buffer_changed)
-        self.binary_data_ascii_text_view.connect('move-cursor',
-                        self.on_binary_data_ascii_text_view_move_cursor)
+        self.binary_data_tree_view.connect('row-activated',
+                        self.on_binary_data_tree_view_row_activated)
 
         self.number_data_dec_radio.connect('toggled',
                         self.on_number_data_dec_radio_toggled)
@@ -446,11 +261,9 @@ class RegValueEditDialog(Gtk.Dialog):
             self.set_icon_from_file(self.icon_registry_binary_filename)
             self.set_size_request(483, 400) #extra few pixels for the scroll bar
 
-            self.binary_data_hex_text_view.get_buffer().set_text(
-                    RegValueEditDialog.byte_array_to_hex(
-                                    self.reg_value.get_interpreted_data(), 8))
-            # This is already called with the statement above
-            #self.on_binary_data_hex_text_view_buffer_changed(None)
+            self.binary_data = bytearray(
+                                self.reg_value.get_interpreted_data() or [])
+            self.update_binary_data_rows()
 
         elif self.reg_value.type in [misc.REG_DWORD,
                                      misc.REG_DWORD_BIG_ENDIAN,
@@ -486,11 +299,7 @@ class RegValueEditDialog(Gtk.Dialog):
                                             self.string_data_entry.get_text())
 
         elif self.reg_value.type == misc.REG_BINARY:
-            buffer = self.binary_data_hex_text_view.get_buffer()
-            text = buffer.get_text(buffer.get_start_iter(),
-                                  buffer.get_end_iter(),True)
-            self.reg_value.set_interpreted_data(
-                                    RegValueEditDialog.hex_to_byte_array(text))
+            self.reg_value.set_interpreted_data(self.binary_data)
 
         elif self.reg_value.type in [misc.REG_DWORD,
                                      misc.REG_DWORD_BIG_ENDIAN,
@@ -529,7 +338,7 @@ class RegValueEditDialog(Gtk.Dialog):
             self.string_data_entry.grab_focus()
         if self.reg_value.type == misc.REG_BINARY:
             self.type_notebook.set_current_page(1)
-            self.binary_data_hex_text_view.grab_focus()
+            self.binary_data_tree_view.grab_focus()
         if self.reg_value.type == misc.REG_DWORD:
             self.type_notebook.set_current_page(2)
             self.number_data_entry.grab_focus()
@@ -545,268 +354,90 @@ class RegValueEditDialog(Gtk.Dialog):
         if self.brand_new:
             self.name_entry.grab_focus()
 
-    def on_binary_data_hex_text_view_buffer_changed(self, widget):
-        if self.disable_signals:
-            return
-        self.disable_signals = True
-
-        # This is the same as 'widget'
-        hex_buffer = self.binary_data_hex_text_view.get_buffer()
-        ascii_buffer = self.binary_data_ascii_text_view.get_buffer()
-        addr_buffer = self.binary_data_addr_text_view.get_buffer()
-
-        insert_iter = hex_buffer.get_iter_at_mark(hex_buffer.get_insert())
-        insert_char_offs = insert_iter.get_offset()
-        #print "cursor at:", insert_char_offs
-
-        text = hex_buffer.get_text(hex_buffer.get_start_iter(),
-                                   hex_buffer.get_end_iter(), True)
-        before_len = len(text)
-        text = RegValueEditDialog.check_hex_string(text).strip()
-        after_len = len(text)
-
-        hex_buffer.set_text(text)
-        ascii_buffer.set_text(RegValueEditDialog.hex_to_ascii(text))
-        addr_buffer.set_text(RegValueEditDialog.hex_to_addr(text))
-
-        #print "cursor now at:", insert_char_offs + (after_len - before_len)
-        hex_buffer.place_cursor(hex_buffer.get_iter_at_offset(
-                                insert_char_offs + self.hex_cursor_shift))
-        self.hex_cursor_shift = 0
-        self.disable_signals = False
-
-    def on_binary_data_hex_text_view_buffer_insert_text(self, widget, iter,
-                                                        text, length):
-        """callback for text inserted into the hex field.
-            The purpose of this function is only to update the cursor"""
-        if self.disable_signals:
-            return
-        self.disable_signals = True
-
-        offset = iter.get_offset()
-        whole_text = widget.get_text(widget.get_start_iter(),
-                                    widget.get_end_iter(),True)
-
-        # Construct the final text
-        final_text = ""
-        for i in range(offset):
-            final_text += whole_text[i]
-        for ch in text:
-            final_text += ch
-        for i in range(offset, len(whole_text)):
-            final_text += whole_text[i]
-        final_text = self.check_hex_string(final_text)
-
-        # Here we properly adjust the cursor
-        count = 0
-        # It could be that the user typed an invalid character,
-        # so we'll play it safe
-        limit = len(final_text)
-        # Go through the inserted characters and
-        # see if any have been replaced by white space
-        for i in range(offset, offset + length + count + 1):
-            if i < limit and (final_text[i] == ' ' or final_text[i] == '\n'):
-                count += 1
-        self.hex_cursor_shift = count
-
-        self.disable_signals = False
-
-    def on_binary_data_hex_text_view_buffer_delete_range(self, widget,
-                                                        start, end):
-        """Callback for text inserted into the hex field.
-            The purpose of this function is only to update the cursor"""
-        if (self.disable_signals):
-            return
-        self.disable_signals = True
-
-        text = widget.get_text(start, end)
-        if (text == ' ') or (text == '\n'):
-            # If the user deleted whitespace,
-            # they probably wanted to delete whatever was before it
-            new_start = widget.get_iter_at_offset(start.get_offset() - 1)
-            # If this worked as expected, programming would be too easy :P
-            #widget.delete(new_start, start)
-
-        self.disable_signals = False
-
-    def on_binary_data_ascii_text_view_buffer_changed(self, widget):
-        """this function formats the text in the ascii field
-            whenever it's changed"""
-        if (self.disable_signals):
-            return
-
-        self.disable_signals = True
-        if widget is None:
-            widget = self.binary_data_ascii_text_view.get_buffer()
-
-        # Stuff we need to move the cursor properly later
-
-        # Insert means cursor, or "the insertion point" as gtk calls it
-        cursor_iter = widget.get_iter_at_mark(widget.get_insert())
-        cursor_offset = cursor_iter.get_offset()
-
-        text = widget.get_text(widget.get_start_iter(),
-                                widget.get_end_iter(), True)
-        text = self.check_ascii_string(text)
-        widget.set_text(text)
-
-        # Calling this function below will translate the hex back
-        # into our ascii box, making errors easier to spot
-        self.disable_signals = False
-        self.on_binary_data_hex_text_view_buffer_changed(None)
-        self.disable_signals = True
+    def update_binary_data_rows(self, changed_line=None):
+        """Make the binary editor show what's in self.binary_data after it
+            changed. If 'changed_line' is given and the length hasn't changed
+            only that line is redrawn, otherwise every line on screen is.
+        There's always a line after the last byte to type new bytes into."""
+        line_length = RegValueEditDialog.binary_line_length
+        line_count = len(self.binary_data) / line_length + 1
+        store = self.binary_data_store
+        row_count = len(store)
+
+        if (line_count != row_count and
+                abs(line_count - row_count) > 1000):
+            # Filling a big store is a lot quicker when nothing's watching it
+            self.binary_data_tree_view.set_model(None)
+        while (row_count < line_count):
+            store.append([row_count])
+            row_count += 1
+        while (row_count > line_count):
+            row_count -= 1
+            store.remove(store.get_iter(row_count))
+        if (self.binary_data_tree_view.get_model() is None):
+            self.binary_data_tree_view.set_model(store)
+
+        if (changed_line is not None and changed_line < row_count):
+            path = Gtk.TreePath(changed_line)
+            store.row_changed(path, store.get_iter(path))
+        else:
+            self.binary_data_tree_view.queue_draw()
+
+    def on_binary_data_cell_data(self, column, renderer, model, iter,
+                                 column_index):
+        """Only called for lines that are on screen."""
+        line_length = RegValueEditDialog.binary_line_length
+        start = model.get_value(iter, 0) * line_length
+        data = self.binary_data[start:start + line_length]
+
+        if (column_index == 0):
+            text = "%04X" % (start)
+        elif (column_index == 1):
+            text = RegValueEditDialog.byte_array_to_hex(data, line_length)
+        else:
+            text = RegValueEditDialog.byte_array_to_ascii(data)
+        renderer.set_property('text', text)
+
+    def on_binary_data_hex_edited(self, renderer, path, new_text):
+        """The line at 'path' is replaced with however many bytes were
+            typed, the lines after it move up or down if that's more or
+            fewer than were there."""
+        self.replace_binary_line(int(path),
+                                 RegValueEditDialog.hex_to_byte_array(new_text))
+
+    def on_binary_data_ascii_edited(self, renderer, path, new_text):
+        line = int(path)
+        line_length = RegValueEditDialog.binary_line_length
+        old_data = self.binary_data[line * line_length:
+                                    (line + 1) * line_length]
+        old_text = RegValueEditDialog.byte_array_to_ascii(old_data)
+
+        new_data = bytearray()
+        for (index, ch) in enumerate(new_text.decode("utf-8", "replace")):
+            if (index < len(old_text) and ch == old_text[index]):
+                # Unchanged, which matters for the bytes shown as '.'
+                new_data.append(old_data[index])
+            elif (ord(ch) < 256):
+                new_data.append(ord(ch))
+            else:
+                new_data.append(ord("?"))
+        self.replace_binary_line(line, new_data)
 
-        #now that we've overwritten everything in the textbuffer,
-        # we have to put the cursor back in the same spot
-        widget.place_cursor(widget.get_iter_at_offset(cursor_offset +
-                                                     self.ascii_cursor_shift))
-        self.ascii_cursor_shift = 0
+    def replace_binary_line(self, line, new_data):
+        line_length = RegValueEditDialog.binary_line_length
+        start = line * line_length
+        old_length = len(self.binary_data)
 
-        self.disable_signals = False
+        self.binary_data[start:start + line_length] = new_data
+        if (len(self.binary_data) == old_length):
+            self.update_binary_data_rows(line)
+        else:
+            self.update_binary_data_rows()
 
-    def on_binary_data_ascii_text_view_buffer_insert_text(self, widget, iter,
-                                                         text, length):
-        if (self.disable_signals):
-            return
-        self.disable_signals = True
-        if widget is None:
-            widget = self.binary_data_ascii_text_view.get_buffer()
-
-        # Get stuff that we need
-        offset = iter.get_offset()
-        inclusive_text = widget.get_text(widget.get_start_iter(), iter, True)
-        # Because each ascii character is 2 hex characters, plus a space
-        hex_pos = int(iter.get_offset() * 3)
-        # Because '\n' counts as a character,
-        # but it doesn't take up 3 spaces in the hex string.
-        hex_pos -= inclusive_text.count('\n') * 2
-        hex_buffer = self.binary_data_hex_text_view.get_buffer()
-        addr_buffer = self.binary_data_addr_text_view.get_buffer()
-        hex_text = hex_buffer.get_text(hex_buffer.get_start_iter(),
-                                       hex_buffer.get_end_iter(), True)
-
-        # Insert into hex_text up to the point
-        # where the new character was inserted
-        new_hex = ""
-        # This works best because the hex_pos can be greater than
-        # len(hex_text) when inserting at the end
-        for ch in hex_text:
-            if len(new_hex) >= hex_pos:
-                break
-            new_hex += ch
-        #insert the new character(s)
-        for i in range(length):
-            # Handle the upper 4 bits of the char
-            new_hex += "%X" % ((ord(text[i]) >> 4) & 0x0F)
-            # Handle the lower 4 bits of the char
-            new_hex += "%X " % (ord(text[i]) & 0x0F)
-        # Insert the rest of the old characters into new_hex
-        while hex_pos < len(hex_text):
-            new_hex += hex_text[hex_pos]
-            hex_pos += 1
-        new_hex = self.check_hex_string(new_hex)
-
-        # Here we properly adjust the cursor
-        final_text = self.hex_to_ascii(new_hex)
-        count = 0
-        # Go through the inserted characters and
-        # see if any have been replaced by '\n's
-        for i in range(offset, offset + length + count):
-            if (final_text[i] == '\n'):
-                count += 1
-        hex_buffer.set_text(new_hex) # Set the text
-        # Tell the on_changed() function to shift the cursor,
-        # since it has no effect if we call place_cursor() from here
-        self.ascii_cursor_shift = count
-        # Can't forget to update the address text!
-        addr_buffer.set_text(self.hex_to_addr(new_hex))
-        self.disable_signals = False
-
-    def on_binary_data_ascii_text_view_buffer_delete_range(self, widget,
-                                                          start, end):
-        if (self.disable_signals):
-            return
-        self.disable_signals = True
-
-        #get stuff that we need
-        text = widget.get_text(start, end, True)
-        beginning_text = widget.get_text(widget.get_start_iter(), start, True)
-        inclusive_text = widget.get_text(widget.get_start_iter(), end, True)
-        hex_buffer = self.binary_data_hex_text_view.get_buffer()
-        addr_buffer = self.binary_data_addr_text_view.get_buffer()
-        hex_text = hex_buffer.get_text(hex_buffer.get_start_iter(),
-                                       hex_buffer.get_end_iter(),True)
-        # This will tell us if any extra characters need to be deleted later
-        new_end_iter = None
-
-        # We assume that the user pressed backspace and NOT delete.
-        # We don't get any indicator of which key was pressed so
-        #   without adding another complex function, this is the best we can do
-        if text == '\n':
-            # So later we can delete from a new start to the current start
-            new_end_iter = start
-            # Also delete the character before the '\n'
-            start = widget.get_iter_at_offset(start.get_offset() - 1)
-
-        # Adjust the values for use in the hex field.
-        # This is basically the same as count('\n') + 1
-
-        #because each ascii character is 2 hex characters, plus a space
-        hex_start = int(start.get_offset() * 3)
-        # Because '\n' counts as a character,
-        # but it doesn't take up 3 spaces in the hex string.
-        hex_start -= beginning_text.count('\n') * 2
-        hex_end = int(end.get_offset() * 3)
-        hex_end -= inclusive_text.count('\n') * 2
-
-        new_hex = ""
-        # Insert into hex_text up to the point where characters were deleted
-        for i in range(hex_start):
-            new_hex += hex_text[i]
-        # Insert the characters after the deleted characters.
-        # We simply ignore the deleted characters
-        for i in range(hex_end, len(hex_text)):
-            new_hex += hex_text[i]
-
-        # Set the text
-        hex_buffer.set_text(RegValueEditDialog.check_hex_string(new_hex))
-        # Can't forget to update the address text!
-        addr_buffer.set_text(RegValueEditDialog.hex_to_addr(new_hex))
-
-        if (new_end_iter is not None):
-            # This causes a warning because of bad iterators! Makes no sense
-            widget.delete(start, new_end_iter)
-
-        self.disable_signals = False
-
-    def on_binary_data_ascii_text_view_move_cursor(self, textview, step_size,
-                                                    count, extend_selection):
-        """This function handles cursor movement.
-            For now it only responds to text selection"""
-        print "ext_sel", extend_selection
-        # The following doesn't work... even if extend_selection is true,
-        #   get_selection_bounds() still returns nothing
-#        if (not extend_selection) or (self.disable_signals):
-#            return
-#        self.disable_signals = True
-#
-#        # Get stuff we need
-#        ascii_buffer = textview.get_buffer()
-#        # This function returns 2 iterators
-#        (start, end) = ascii_buffer.get_selection_bounds()
-#        hex_buffer = self.binary_data_hex_text_view.get_buffer()
-#
-#        # Because each ascii character is 2 hex characters, plus a space
-#        hex_start = int(start.get_offset() * 3)
-#        # Because '\n' counts as a character,
-#        # but it doesn't take up 3 spaces in the hex string.
-#        hex_start -= (hex_start/25) * 2
-#        hex_end = int(end.get_offset() * 3)
-#        hex_end -= (hex_end/25) * 2
-#        hex_buffer.select_range(hex_buffer.get_iter_at_offset(hex_start),
-#                                hex_buffer.get_iter_at_offset(hex_end))
-#
-#        self.disable_signals = False
+    def on_binary_data_tree_view_row_activated(self, tree_view, path, column):
+        if (column is tree_view.get_column(0)):
+            column = tree_view.get_column(1)
+        tree_view.set_cursor(path, column, True)
 
     def on_number_data_hex_radio_toggled(self, widget):
         if (not widget.get_active()):
@@ -874,121 +505,30 @@ class RegValueEditDialog(Gtk.Dialog):
     def remove_string_white_space(str):
         return string.join(str.split(), "")
 
-    @staticmethod
-    def check_hex_string(old_string, line_length=8, remove_orphaned = False):
-        new_string = ""
-        length = 0
-        insert_space = False
-        for ch in old_string:
-            if (ch in string.hexdigits):
-                new_string += string.upper(ch)
-                if (insert_space):
-                    new_string += " "
-                    length += 1
-                insert_space = not insert_space
-
-            if (length >= line_length):
-                new_string += "\n"
-                length = 0
-
-        if (insert_space and remove_orphaned):
-            new_string = new_string.strip()[:len(new_string) - 1]
-
-        return new_string
-
-    @staticmethod
-    def check_ascii_string(string, line_length=8):
-        new_string = ""
-        digits = ""
-        length = 0
-        #insert a '\n' every line_length characters.
-        for ch in string:
-            if ch != '\n': #ignore carrage returns alreadys present
-                new_string += ch
-                length += 1
-                if (length >= line_length):
-                    new_string += "\n"
-                    length = 0
-
-        return new_string.strip()
-
-    @staticmethod
-    def hex_to_ascii(hex_string, line_length=8):
-        ascii_string = ""
-
-        digits = ""
-        length = 0
-        for ch in hex_string:
-            if (ch in string.hexdigits):
-                digits += ch
-
-            if (len(digits) >= 2):
-                new_chr = chr(string.atol(digits, 0x10))
-                if (new_chr in (string.punctuation +
-                                string.digits +
-                                # We don't just use string.printables because
-                                # that inclues '\n' and '\r' which we don't want
-                                # to put into the ascii box
-                                string.ascii_letters + ' ')):
-                    ascii_string += new_chr
-                else:
-                    ascii_string += "."
-                length += 1
-                digits = ""
-
-            if (length >= line_length):
-                ascii_string += "\n"
-                length = 0
-
-        return ascii_string
-
-    @staticmethod
-    def hex_to_addr(old_string, line_length=8):
-        new_string = ""
-
-        digits = ""
-        length = 0
-        addr = 0
-        for ch in old_string:
-            if (ch in string.hexdigits):
-                digits += ch
-
-            if (len(digits) >= 2):
-
-                if (length % line_length) == 0:
-                    new_string += "%04X\n" % addr
-                    addr += line_length
-
-                length += 1
-                digits = ""
-
-        return new_string
-
     @staticmethod
     def byte_array_to_hex(array, line_length=8):
-        new_string = ""
+        """returns 'array' as upper case hex, a space between bytes and
+            'line_length' bytes to a line"""
+        hex_string = str(bytearray(array)).encode("hex").upper()
+        pairs = [hex_string[index:index + 2]
+                 for index in xrange(0, len(hex_string), 2)]
 
-        for byte in array:
-            new_string += "%02x" % byte
+        return "\n".join([" ".join(pairs[index:index + line_length])
+                          for index in xrange(0, len(pairs), line_length)])
 
-        return RegValueEditDialog.check_hex_string(new_string,
-                                                  line_length, False)
+    @staticmethod
+    def byte_array_to_ascii(array):
+        """returns 'array' as it's shown in the ascii column"""
+        return str(bytearray(array)).translate(RegValueEditDialog.ascii_table)
 
     @staticmethod
     def hex_to_byte_array(hex_string):
-        array = []
-
-        digits = ""
-        for ch in hex_string:
-            if (ch in string.hexdigits):
-                digits += ch
-
-            if (len(digits) >= 2):
-                byte = string.atol(digits, 0x10)
-                array.append(byte)
-                digits = ""
+        """Anything that isn't a hex digit is ignored, and so is a trailing
+            odd digit.
 
-        return array
+        returns a bytearray"""
+        digits = RegValueEditDialog.non_hex_digits.sub("", hex_string)
+        return bytearray.fromhex(digits[:len(digits) & ~1])
 
 
 class RegKeyEditDialog(Gtk.Dialog):
@@ -1225,6 +765,240 @@ class RegSearchDialog(Gtk.Dialog):
 
         return None
 
+class RegDiffDialog(Gtk.Dialog):
+    """Shows the differences a comparison finds as they come in, see
+        RegistryDiff."""
+
+    def __init__(self, path, reference_name, current_name):
+        super(RegDiffDialog, self).__init__()
+
+        self.path = path
+        self.reference_name = reference_name
+        self.current_name = current_name
+        # Kept for the report
+        self.changes = []
+
+        self.create()
+
+    def create(self):
+        self.set_title(_("Differences below %s") % (self.path))
+        self.set_border_width(5)
+        self.set_default_size(800, 450)
+        self.set_decorated(True)
+
+        scrolledwindow = Gtk.ScrolledWindow(None, None)
+        scrolledwindow.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                  Gtk.PolicyType.AUTOMATIC)
+        scrolledwindow.set_shadow_type(Gtk.ShadowType.IN)
+        self.vbox.pack_start(scrolledwindow, True, True, 0)
+
+        # change, key, value, reference data, current data
+        self.changes_store = Gtk.ListStore(GObject.TYPE_STRING,
+                                           GObject.TYPE_STRING,
+                                           GObject.TYPE_STRING,
+                                           GObject.TYPE_STRING,
+                                           GObject.TYPE_STRING)
+        self.changes_tree_view = Gtk.TreeView(self.changes_store)
+        scrolledwindow.add(self.changes_tree_view)
+
+        titles = [_("Change"), _("Key"), _("Value"), self.reference_name,
+                  self.current_name]
+        for (column_index, title) in enumerate(titles):
+            column = Gtk.TreeViewColumn()
+            column.set_title(title)
+            column.set_resizable(True)
+            column.set_sort_column_id(column_index)
+            renderer = Gtk.CellRendererText()
+            renderer.set_property('ellipsize', Pango.EllipsizeMode.END)
+            column.pack_start(renderer, True)
+            column.add_attribute(renderer, 'text', column_index)
+            self.changes_tree_view.append_column(column)
+
+        self.status_label = Gtk.Label(_("Comparing..."))
+        self.status_label.set_alignment(0, 0.5)
+        self.vbox.pack_start(self.status_label, False, False, 5)
+
+        # dialog buttons
+        self.action_area.set_layout(Gtk.ButtonBoxStyle.END)
+
+        self.save_button = Gtk.Button(_("Save Report..."), Gtk.STOCK_SAVE_AS)
+        self.action_area.pack_start(self.save_button, False, False, 0)
+
+        self.close_button = Gtk.Button(_("Close"), Gtk.STOCK_CLOSE)
+        self.close_button.set_can_default(True)
+        self.add_action_widget(self.close_button, Gtk.ResponseType.CLOSE)
+
+        self.set_default_response(Gtk.ResponseType.CLOSE)
+
+        # signals/events
+        self.save_button.connect('clicked', self.on_save_button_clicked)
+
+    def add_changes(self, changes):
+        change_strings = {RegistryDiff.ADDED: _("Added"),
+                          RegistryDiff.REMOVED: _("Removed"),
+                          RegistryDiff.CHANGED: _("Changed")}
+
+        self.changes.extend(changes)
+        for (kind, path, value_name, old, new) in changes:
+            self.changes_store.append([change_strings[kind], path,
+                                       value_name or "", old or "",
+                                       new or ""])
+
+    def set_status(self, message):
+        self.status_label.set_text(message)
+
+    def on_save_button_clicked(self, widget):
+        dialog = Gtk.FileChooserDialog(title=_("Save Report"),
+                            action=Gtk.FileChooserAction.SAVE,
+                            parent=self,
+                            buttons=(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                                    Gtk.STOCK_SAVE, Gtk.ResponseType.OK))
+        dialog.set_do_overwrite_confirmation(True)
+        dialog.set_current_name("registry-diff.txt")
+
+        filename = None
+        if (dialog.run() == Gtk.ResponseType.OK):
+            filename = dialog.get_filename()
+        dialog.destroy()
+        if (filename is None):
+            return
+
+        try:
+            with open(filename, "w") as report:
+                report.write((u"# %s: %s\n# %s: %s\n# %s\n" % (
+                                _("Reference"), self.reference_name,
+                                _("Current"), self.current_name,
+                                self.path)).encode("utf-8"))
+                for change in self.changes:
+                    report.write(RegistryDiff.format_change(change).encode(
+                                                            "utf-8") + "\n")
+        except (IOError, OSError) as e:
+            message_box = Gtk.MessageDialog(self, Gtk.DialogFlags.MODAL,
+                                            Gtk.MessageType.ERROR,
+                                            Gtk.ButtonsType.OK,
+                                            _("Failed to write '%s': %s") % (
+                                                    filename, e.strerror))
+            message_box.run()
+            message_box.destroy()
+
+
+class RegStatsDialog(Gtk.Dialog):
+    """Shows what a RegistryStats has collected, see RegistryStats."""
+
+    def __init__(self, stats):
+        super(RegStatsDialog, self).__init__()
+
+        self.stats = stats
+
+        self.create()
+        self.refresh()
+
+    def create(self):
+        self.set_title(_("Statistics"))
+        self.set_border_width(5)
+        self.set_default_size(700, 350)
+        self.set_decorated(True)
+
+        scrolledwindow = Gtk.ScrolledWindow(None, None)
+        scrolledwindow.set_policy(Gtk.PolicyType.AUTOMATIC,
+                                  Gtk.PolicyType.AUTOMATIC)
+        scrolledwindow.set_shadow_type(Gtk.ShadowType.IN)
+        self.vbox.pack_start(scrolledwindow, True, True, 0)
+
+        # name, count, mean, max, total, histogram
+        self.stats_store = Gtk.ListStore(GObject.TYPE_STRING,
+                                         GObject.TYPE_INT,
+                                         GObject.TYPE_DOUBLE,
+                                         GObject.TYPE_DOUBLE,
+                                         GObject.TYPE_DOUBLE,
+                                         GObject.TYPE_STRING)
+        self.stats_tree_view = Gtk.TreeView(self.stats_store)
+        scrolledwindow.add(self.stats_tree_view)
+
+        titles = [_("Timing"), _("Count"), _("Mean (ms)"), _("Max (ms)"),
+                  _("Total (ms)"), _("Histogram")]
+        for (column_index, title) in enumerate(titles):
+            column = Gtk.TreeViewColumn()
+            column.set_title(title)
+            column.set_resizable(True)
+            column.set_sort_column_id(column_index)
+            renderer = Gtk.CellRendererText()
+            column.pack_start(renderer, True)
+            column.add_attribute(renderer, 'text', column_index)
+            self.stats_tree_view.append_column(column)
+
+        # dialog buttons
+        self.action_area.set_layout(Gtk.ButtonBoxStyle.END)
+
+        self.reset_button = Gtk.Button(_("Reset"), Gtk.STOCK_CLEAR)
+        self.action_area.pack_start(self.reset_button, False, False, 0)
+
+        self.save_button = Gtk.Button(_("Save as JSON..."), Gtk.STOCK_SAVE_AS)
+        self.action_area.pack_start(self.save_button, False, False, 0)
+
+        self.refresh_button = Gtk.Button(_("Refresh"), Gtk.STOCK_REFRESH)
+        self.action_area.pack_start(self.refresh_button, False, False, 0)
+
+        self.close_button = Gtk.Button(_("Close"), Gtk.STOCK_CLOSE)
+        self.close_button.set_can_default(True)
+        self.add_action_widget(self.close_button, Gtk.ResponseType.CLOSE)
+
+        self.set_default_response(Gtk.ResponseType.CLOSE)
+
+        # signals/events
+        self.reset_button.connect('clicked', self.on_reset_button_clicked)
+        self.save_button.connect('clicked', self.on_save_button_clicked)
+        self.refresh_button.connect('clicked', self.on_refresh_button_clicked)
+
+    def refresh(self):
+        self.stats_store.clear()
+        bucket_names = RegistryStats.get_bucket_names()
+        for (name, timing) in sorted(self.stats.summarize().items()):
+            histogram = ", ".join(["%s: %d" % (bucket_name,
+                                               timing["histogram"][bucket_name])
+                                   for bucket_name in bucket_names
+                                   if bucket_name in timing["histogram"]])
+            self.stats_store.append([name, timing["count"],
+                                     round(timing["mean_ms"], 2),
+                                     round(timing["max_ms"], 2),
+                                     round(timing["total_ms"], 2), histogram])
+
+    def on_reset_button_clicked(self, widget):
+        self.stats.reset()
+        self.refresh()
+
+    def on_refresh_button_clicked(self, widget):
+        self.refresh()
+
+    def on_save_button_clicked(self, widget):
+        dialog = Gtk.FileChooserDialog(title=_("Save Statistics"),
+                            action=Gtk.FileChooserAction.SAVE,
+                            parent=self,
+                            buttons=(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                                    Gtk.STOCK_SAVE, Gtk.ResponseType.OK))
+        dialog.set_do_overwrite_confirmation(True)
+        dialog.set_current_name("gwregedit-stats.json")
+
+        filename = None
+        if (dialog.run() == Gtk.ResponseType.OK):
+            filename = dialog.get_filename()
+        dialog.destroy()
+        if (filename is None):
+            return
+
+        try:
+            with open(filename, "w") as stats_file:
+                self.stats.dump(stats_file)
+        except (IOError, OSError) as e:
+            message_box = Gtk.MessageDialog(self, Gtk.DialogFlags.MODAL,
+                                            Gtk.MessageType.ERROR,
+                                            Gtk.ButtonsType.OK,
+                                            _("Failed to write '%s': %s") % (
+                                                    filename, e.strerror))
+            message_box.run()
+            message_box.destroy()
+
+
 class RegPermissionsDialog(Gtk.Dialog):
     def __init__(self, users, permissions):
         super(RegPermissionsDialog, self).__init__()
@@ -0,0 +1,1067 @@
+# Samba GTK+ frontends
+#
+# Copyright (C) 2010 Sergio Martins <sergio97@gmail.com>
+# Copyright (C) 2012 Jelmer Vernooij <jelmer@samba.org>
+# Copyright (C) 2012 Dhananjay Sathe <dhananjaysathe@gmail.com>
+
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Registry keys and values, registry files and the local search
+index."""
+
+import bisect
+import codecs
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+from samba.dcerpc import misc
+
+
+class RegistryValue(object):
+    # There can be hundreds of thousands of these, a __dict__ each would
+    #   cost more than the values themselves.
+    __slots__ = ("name", "type", "data", "parent", "decoded_cache",
+                 "old_name")
+
+    def __init__(self, name, type, data, parent):
+        self.name = RegistryKey.intern_name(name)
+        self.type = type
+        # The raw data as a bytearray (the bindings give us lists of ints,
+        #   which take about 9 times the space), or None.
+        if (data is not None and not isinstance(data, bytearray)):
+            data = bytearray(data)
+        self.data = data
+        self.parent = parent
+        # (type, interpreted data, data string) for the current data, decoding
+        #   is too slow to repeat for every row drawn and every search.
+        #   Cleared by set_interpreted_data().
+        self.decoded_cache = None
+        # Set by the rename dialog
+        self.old_name = None
+
+    def get_absolute_path(self):
+        if self.parent is None:
+            return self.name
+        else:
+            return self.parent.get_absolute_path() + "\\" + self.name
+
+    def get_data_string(self):
+        return self.get_decoded()[2]
+
+    def get_interpreted_data(self):
+        return self.get_decoded()[1]
+
+    def get_decoded(self):
+        """The type is checked because the edit dialogs change it in place.
+
+        returns (type, interpreted data, data string)"""
+        if (self.decoded_cache is None or self.decoded_cache[0] != self.type):
+            stats = RegistryStats.current
+            if (stats is not None):
+                start = time.time()
+            interpreted_data = self.interpret_data()
+            self.decoded_cache = (self.type, interpreted_data,
+                                  self.format_data_string(interpreted_data))
+            if (stats is not None):
+                stats.record("decode values", time.time() - start)
+
+        return self.decoded_cache
+
+    def format_data_string(self, interpreted_data):
+        if interpreted_data is None or len(self.data) == 0:
+            return _("(value not set)")
+        elif self.type in (misc.REG_SZ, misc.REG_EXPAND_SZ):
+            return interpreted_data
+        elif self.type == misc.REG_BINARY:
+            return str(bytearray(interpreted_data)).encode("hex").upper()
+        elif self.type == misc.REG_DWORD:
+            return "0x%08X" % (interpreted_data)
+        elif self.type == misc.REG_DWORD_BIG_ENDIAN:
+            return "0x%08X" % (interpreted_data)
+        elif self.type == misc.REG_MULTI_SZ:
+            return " ".join(interpreted_data)
+        elif self.type == misc.REG_QWORD:
+            return "0x%016X" % (interpreted_data)
+        else:
+            # The data of types we don't understand is the raw bytes
+            return str(bytearray(interpreted_data)).encode("hex").upper()
+
+    def interpret_data(self):
+        if self.data is None:
+            return None
+
+        if self.type in (misc.REG_SZ, misc.REG_EXPAND_SZ):
+            # NULs are dropped wherever they are, not just at the end
+            return RegistryValue.decode_utf16(self.data).replace(u"\x00", u"")
+        elif self.type == misc.REG_BINARY:
+            return self.data
+        elif self.type == misc.REG_DWORD:
+            return RegistryValue.unpack_number("<I", self.data)
+        elif self.type == misc.REG_DWORD_BIG_ENDIAN:
+            return RegistryValue.unpack_number(">I", self.data)
+        elif self.type == misc.REG_MULTI_SZ:
+            # Every string is NUL terminated and the list ends with an empty
+            #   string. Anything after the last NUL isn't a whole string.
+            result = RegistryValue.decode_utf16(self.data).split(u"\x00")[:-1]
+            if len(result) > 0:
+                result.pop() # remove last systematic empty string
+
+            return result
+        elif self.type == misc.REG_QWORD:
+            return RegistryValue.unpack_number("<Q", self.data)
+        else:
+            return self.data
+
+    @staticmethod
+    def decode_utf16(data):
+        """Decode little endian UTF-16, a trailing odd byte is ignored.
+
+        returns a unicode string"""
+        length = len(data) & ~1
+        try:
+            return bytearray(data[:length]).decode("utf-16-le")
+        except (UnicodeDecodeError, ValueError):
+            # Unpaired surrogates (or a corrupt buffer), do it one character
+            #   at a time like Windows would.
+            return u"".join([unichr((data[index + 1] << 8) + data[index])
+                             for index in xrange(0, length, 2)])
+
+    @staticmethod
+    def encode_utf16(string):
+        """Gtk gives us UTF-8 encoded strings.
+
+        returns 'string' as a bytearray of little endian UTF-16"""
+        if isinstance(string, str):
+            string = string.decode("utf-8", "replace")
+        return bytearray(string.encode("utf-16-le"))
+
+    @staticmethod
+    def unpack_number(format, data):
+        """returns the number packed at the start of 'data' or 0L if 'data'
+            is too short"""
+        size = struct.calcsize(format)
+        if len(data) < size:
+            return 0L
+
+        return long(struct.unpack(format, str(bytearray(data[:size])))[0])
+
+    def set_interpreted_data(self, data):
+        self.decoded_cache = None
+        self.data = bytearray()
+
+        if data is None:
+            self.data = None
+        elif self.type in (misc.REG_SZ, misc.REG_EXPAND_SZ):
+            self.data.extend(RegistryValue.encode_utf16(data))
+        elif self.type == misc.REG_BINARY:
+            self.data = bytearray(data)
+        elif self.type == misc.REG_DWORD:
+            self.data.extend(bytearray(struct.pack("<I", data & 0xFFFFFFFF)))
+        elif self.type == misc.REG_DWORD_BIG_ENDIAN:
+            self.data.extend(bytearray(struct.pack(">I", data & 0xFFFFFFFF)))
+        elif self.type == misc.REG_MULTI_SZ:
+            for string in data:
+                self.data.extend(RegistryValue.encode_utf16(string))
+
+                self.data.append(0)
+                self.data.append(0)
+
+            self.data.append(0)
+            self.data.append(0)
+        elif self.type == misc.REG_QWORD:
+            self.data.extend(bytearray(struct.pack("<Q",
+                                               data & 0xFFFFFFFFFFFFFFFF)))
+        else:
+            self.data = bytearray(data)
+
+    def list_view_representation(self):
+        return [self.name, RegistryValue.get_type_string(self.type),
+                self.get_data_string(), self]
+
+    @staticmethod
+    def get_type_string(type):
+        type_strings = {
+            misc.REG_SZ: _("String"),
+            misc.REG_BINARY: _("Binary Data"),
+            misc.REG_EXPAND_SZ: _("Expandable String"),
+            misc.REG_DWORD: _("32-bit Number (little endian)"),
+            misc.REG_DWORD_BIG_ENDIAN: _("32-bit Number (big endian)"),
+            misc.REG_MULTI_SZ: _("Multi-String"),
+            misc.REG_QWORD: _("64-bit Number (little endian)")
+            }
+
+        return type_strings[type]
+
+
+class RegistryKey(object):
+    # See RegistryValue
+    __slots__ = ("name", "parent", "handle", "changed_time", "num_subkeys",
+                 "num_values", "old_name", "path_cache")
+
+    # Names shared between keys and values, see intern_name()
+    interned_names = {}
+    interned_names_size = 65536
+
+    def __init__(self, name, parent):
+        self.name = RegistryKey.intern_name(name)
+        self.parent = parent
+        self.handle = None
+        # The last write time reported by EnumKey() or QueryInfoKey(), None
+        #   if we don't know it
+        self.changed_time = None
+        # The number of subkeys and values QueryInfoKey() last reported,
+        #   None if we haven't asked
+        self.num_subkeys = None
+        self.num_values = None
+        # Set by the rename dialog
+        self.old_name = None
+        # (parent's path, name, absolute path), see get_absolute_path()
+        self.path_cache = None
+
+    @staticmethod
+    def intern_name(name):
+        """The same few names ("Parameters", "Enum", "DisplayName"...) turn up
+            all over the registry, so share one copy of each.
+        intern() only takes byte strings, so unicode names go in a table
+            which starts again when it gets too big rather than holding on
+            to every GUID we've ever seen.
+
+        returns 'name' or an equal string we've seen before"""
+        if isinstance(name, str):
+            return intern(name)
+
+        names = RegistryKey.interned_names
+        if (len(names) >= RegistryKey.interned_names_size):
+            names.clear()
+        return names.setdefault(name, name)
+
+    def get_absolute_path(self):
+        """The path is cached, but keys can be renamed so it's rebuilt if
+            our name or our parent's path has changed. The parent's path is
+            the same object if it hasn't changed, so that's cheap to check."""
+        if self.parent is None:
+            return self.name
+
+        parent_path = self.parent.get_absolute_path()
+        cache = self.path_cache
+        if (cache is None or cache[0] is not parent_path or
+                cache[1] is not self.name):
+            cache = (parent_path, self.name, parent_path + "\\" + self.name)
+            self.path_cache = cache
+
+        return cache[2]
+
+    def get_root_key(self):
+        if self.parent is None:
+            return self
+        else:
+            return self.parent.get_root_key()
+
+    def list_view_representation(self):
+        return [self.name, self]
+
+
+class RegistryIndex(object):
+    """An on-disk (SQLite) copy of the key paths, value names and data strings
+        of a server's registry, so that searches don't have to fetch
+        everything from the server again.
+    Every key remembers the last write time it had when it was indexed, so
+        updating the index only has to refetch keys that have changed.
+
+    Keys are stored in search order: root keys in the order they were given
+        to set_root_keys(), then depth first with subkeys in alphabetical
+        order (which is the order Windows lists them in)."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        # The database is shared by the indexing and search threads
+        self.lock = threading.RLock()
+
+        directory = os.path.dirname(filename)
+        if (directory != "" and not os.path.isdir(directory)):
+            os.makedirs(directory)
+
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS root_keys (
+                name TEXT PRIMARY KEY,
+                position INTEGER);
+            CREATE TABLE IF NOT EXISTS keys (
+                sort TEXT PRIMARY KEY,
+                parent TEXT,
+                path TEXT,
+                name TEXT,
+                changed_time INTEGER,
+                num_subkeys INTEGER);
+            CREATE INDEX IF NOT EXISTS keys_parent ON keys (parent);
+            CREATE TABLE IF NOT EXISTS reg_values (
+                key_sort TEXT,
+                position INTEGER,
+                name TEXT,
+                data TEXT,
+                type INTEGER);
+            CREATE INDEX IF NOT EXISTS reg_values_key ON reg_values (key_sort);
+            """)
+        # Indexes made before the type was kept have it as NULL, which
+        #   RegistryDiff takes as unknown
+        if ("type" not in [row[1] for row in
+                           self.db.execute("PRAGMA table_info(reg_values)")]):
+            self.db.execute("ALTER TABLE reg_values ADD COLUMN type INTEGER")
+        self.root_positions = dict(self.db.execute(
+                                    "SELECT name, position FROM root_keys"))
+
+    @staticmethod
+    def get_default_filename(server):
+        """returns where the index for 'server' is kept"""
+        server = "".join([(ch.isalnum() or ch in "-_.") and ch or "_"
+                                                          for ch in server])
+        return os.path.join(os.path.expanduser("~"), ".cache", "samba-gtk",
+                            "registry-%s.sqlite" % (server))
+
+    @staticmethod
+    def to_text(string):
+        if (isinstance(string, str)):
+            return string.decode("utf-8", "replace")
+        return unicode(string)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def is_empty(self):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM keys LIMIT 1").fetchone() \
+                                                                      is None
+
+    def set_root_keys(self, names):
+        with self.lock:
+            self.root_positions = dict([(name, position) for (position, name)
+                                                          in enumerate(names)])
+            self.db.execute("DELETE FROM root_keys")
+            self.db.executemany("INSERT INTO root_keys VALUES (?, ?)",
+                                           self.root_positions.items())
+            self.db.commit()
+
+    def get_sort_key(self, path):
+        """returns the key that orders 'path' in search order, or None if
+            its root key isn't known"""
+        names = RegistryIndex.to_text(path).split("\\")
+        if (names[0] not in self.root_positions):
+            return None
+        # \x01 sorts before any character that can be in a key name,
+        #   so a key's subkeys come right after it and before its siblings.
+        return "\x01".join(["%04d" % self.root_positions[names[0]]] +
+                            [name.lower() for name in names[1:]])
+
+    def get_key(self, path):
+        """returns (changed_time, num_subkeys) that 'path' was indexed with,
+            or None if it isn't in the index"""
+        with self.lock:
+            return self.db.execute("SELECT changed_time, num_subkeys FROM keys "
+                                   "WHERE sort = ?",
+                                   (self.get_sort_key(path),)).fetchone()
+
+    def list_key(self, path):
+        """What 'path' looked like when it was indexed, see RegistryDiff.
+
+        returns (subkey names, {value name: (type, data string)}), or None if
+            'path' isn't in the index. The type is None for values indexed
+            by older versions."""
+        sort = self.get_sort_key(path)
+        if (sort is None):
+            return None
+
+        with self.lock:
+            if (self.db.execute("SELECT 1 FROM keys WHERE sort = ?",
+                                (sort,)).fetchone() is None):
+                return None
+            subkey_names = [row[0] for row in self.db.execute(
+                                "SELECT name FROM keys WHERE parent = ? "
+                                "ORDER BY sort", (sort,))]
+            values = dict([(name, (type, data)) for (name, type, data)
+                           in self.db.execute("SELECT name, type, data "
+                                              "FROM reg_values "
+                                              "WHERE key_sort = ?", (sort,))])
+
+        return (subkey_names, values)
+
+    def get_subkey_names(self, path):
+        with self.lock:
+            return [row[0] for row in self.db.execute(
+                                "SELECT name FROM keys WHERE parent = ? "
+                                "ORDER BY sort", (self.get_sort_key(path),))]
+
+    def store_key(self, key, changed_time, value_list, subkey_list):
+        """Replace what we know about 'key'.
+            Subkeys that aren't in 'subkey_list' anymore are removed along
+            with everything below them, the others are left as they were.
+        Changes aren't saved to disk until commit() is called."""
+        path = key.get_absolute_path()
+        sort = self.get_sort_key(path)
+        parent = None
+        if (key.parent is not None):
+            parent = self.get_sort_key(key.parent.get_absolute_path())
+
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO keys VALUES "
+                            "(?, ?, ?, ?, ?, ?)",
+                            (sort, parent, RegistryIndex.to_text(path),
+                             RegistryIndex.to_text(key.name), changed_time,
+                             len(subkey_list)))
+
+            self.db.execute("DELETE FROM reg_values WHERE key_sort = ?",
+                                                                      (sort,))
+            self.db.executemany("INSERT INTO reg_values "
+                                "(key_sort, position, name, data, type) "
+                                "VALUES (?, ?, ?, ?, ?)",
+                                [(sort, position,
+                                  RegistryIndex.to_text(value.name),
+                                  RegistryIndex.to_text(value.get_data_string()),
+                                  value.type)
+                                 for (position, value) in enumerate(value_list)])
+
+            current = set([RegistryIndex.to_text(subkey.name).lower()
+                                                  for subkey in subkey_list])
+            for name in self.get_subkey_names(path):
+                if (name.lower() not in current):
+                    self.remove_key(path + "\\" + name)
+
+    def remove_key(self, path):
+        """Remove 'path' and everything below it from the index."""
+        sort = self.get_sort_key(path)
+        if (sort is None):
+            return
+
+        with self.lock:
+            below = (sort + "\x01", sort + "\x02")
+            self.db.execute("DELETE FROM reg_values WHERE key_sort = ? OR "
+                            "(key_sort >= ? AND key_sort < ?)", (sort,) + below)
+            self.db.execute("DELETE FROM keys WHERE sort = ? OR "
+                            "(sort >= ? AND sort < ?)", (sort,) + below)
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+
+    def find(self, search_items, search_keys, search_values, search_data,
+             start_path=None):
+        """Find the first key after 'start_path' (or the first key at all)
+            matching any of 'search_items', checking things in the same order
+            as a search over the network does: the key's name, then its value
+            names, then its value data.
+
+        returns (key_path, value_name, in_data), value_name is None for a
+            key match and in_data is True if the value's data matched rather
+            than its name. returns None if nothing matches."""
+        key_conditions = []
+        value_conditions = []
+        params = []
+        for text in search_items:
+            text = RegistryIndex.to_text(text)
+            if (search_keys):
+                key_conditions.append("instr(k.name, ?) > 0")
+                params.append(text)
+        value_params = []
+        for text in search_items:
+            text = RegistryIndex.to_text(text)
+            if (search_values):
+                value_conditions.append("instr(v.name, ?) > 0")
+                value_params.append(text)
+            if (search_data):
+                value_conditions.append("instr(v.data, ?) > 0")
+                value_params.append(text)
+        if (len(value_conditions) > 0):
+            key_conditions.append("EXISTS (SELECT 1 FROM reg_values v "
+                                  "WHERE v.key_sort = k.sort AND (%s))" %
+                                  (" OR ".join(value_conditions)))
+            params.extend(value_params)
+        if (len(key_conditions) == 0):
+            return None
+
+        start = ""
+        if (start_path is not None):
+            start = self.get_sort_key(start_path) or ""
+
+        with self.lock:
+            row = self.db.execute("SELECT k.sort, k.path, k.name FROM keys k "
+                                  "WHERE k.sort > ? AND (%s) "
+                                  "ORDER BY k.sort LIMIT 1" %
+                                  (" OR ".join(key_conditions)),
+                                  [start] + params).fetchone()
+            if (row is None):
+                return None
+            (sort, path, name) = row
+
+            if (search_keys):
+                for text in search_items:
+                    if (name.find(RegistryIndex.to_text(text)) >= 0):
+                        return (path, None, False)
+
+            value_rows = self.db.execute("SELECT name, data FROM reg_values "
+                                         "WHERE key_sort = ? ORDER BY position",
+                                         (sort,)).fetchall()
+
+        # Value names are all checked before any of the data
+        for (column, enabled) in ((0, search_values), (1, search_data)):
+            if (not enabled):
+                continue
+            for value_row in value_rows:
+                for text in search_items:
+                    if (value_row[column].find(
+                                        RegistryIndex.to_text(text)) >= 0):
+                        return (path, value_row[0], column == 1)
+
+        return None
+
+
+class RegistryStats(object):
+    """Timings of what the registry editor spends its time on: calls to the
+        server, waiting for a connection's lock, decoding values and filling
+        the tree views. Nothing is timed unless the user turns it on, see
+        'current'.
+    Each kind of timing keeps a count, a total, a maximum and a histogram."""
+
+    # What's being collected into, None while collecting is turned off
+    current = None
+
+    # The upper bounds of the histogram buckets in milliseconds, anything
+    #   slower goes into one more bucket
+    bucket_limits = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        # name -> [count, total seconds, max seconds, [count per bucket]]
+        self.timings = {}
+
+    def record(self, name, seconds):
+        bucket = bisect.bisect_left(RegistryStats.bucket_limits,
+                                    seconds * 1000)
+        with self.lock:
+            timing = self.timings.get(name)
+            if (timing is None):
+                timing = [0, 0.0, 0.0,
+                          [0] * (len(RegistryStats.bucket_limits) + 1)]
+                self.timings[name] = timing
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+            timing[3][bucket] += 1
+
+    def timed(self, name, function):
+        """returns 'function' wrapped so that every call is recorded under
+            'name'"""
+        def timed_function(*args, **kwargs):
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, time.time() - start)
+
+        return timed_function
+
+    @staticmethod
+    @contextlib.contextmanager
+    def timing(name):
+        """Records how long the body of a with statement takes under 'name',
+            if collecting is turned on."""
+        stats = RegistryStats.current
+        if (stats is None):
+            yield
+            return
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            stats.record(name, time.time() - start)
+
+    @staticmethod
+    def get_bucket_names():
+        limits = RegistryStats.bucket_limits
+        return (["<= %d ms" % (limit) for limit in limits] +
+                ["> %d ms" % (limits[-1])])
+
+    def summarize(self):
+        """returns {name: {"count": , "total_ms": , "mean_ms": , "max_ms": ,
+            "histogram": {bucket name: count}}}"""
+        bucket_names = RegistryStats.get_bucket_names()
+        summary = {}
+        with self.lock:
+            for (name, (count, total, maximum, buckets)) in \
+                                                    self.timings.items():
+                summary[name] = {
+                    "count": count,
+                    "total_ms": total * 1000,
+                    "mean_ms": total * 1000 / count,
+                    "max_ms": maximum * 1000,
+                    "histogram": dict([(bucket_names[index], bucket_count)
+                                       for (index, bucket_count)
+                                       in enumerate(buckets)
+                                       if bucket_count > 0])}
+
+        return summary
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.timings = {}
+
+    def dump(self, file):
+        """Write everything collected so far to 'file' as JSON."""
+        json.dump({"started": self.started,
+                   "elapsed_s": time.time() - self.started,
+                   "timings": self.summarize()},
+                  file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+class RegistryDiff(object):
+    """Compares two registries one key at a time. A side can be anything with
+        a list_key() like WinRegPipeManager's or RegistryIndex's: a live
+        server or an offline index of one.
+
+    Changes are (change, key path, value name, reference data, current data)
+        tuples where 'change' is ADDED, REMOVED or CHANGED, from the point of
+        view of the current side. Key changes have a value name of None.
+        A key that's only on one side is reported without its contents.
+    Each key's values are hashed so that keys whose values are the same are
+        passed over without comparing them one by one. Whole subtrees aren't
+        hashed: neither a server nor an index can tell us a subtree's hash
+        without us reading all of it, so it wouldn't save any fetches."""
+
+    ADDED = "added"
+    REMOVED = "removed"
+    CHANGED = "changed"
+
+    @staticmethod
+    def summarize(listing):
+        """Turns what list_key() returned into what compare_key() wants:
+            names are matched case insensitively like Windows does, and the
+            values get a digest so unchanged keys are quick to spot.
+
+        returns ({upper case subkey name: subkey name},
+                 {upper case value name: (value name, type, data string)},
+                 digest of the values), or None if 'listing' is None"""
+        if (listing is None):
+            return None
+        (subkey_names, values) = listing
+
+        subkeys = dict([(RegistryIndex.to_text(name).upper(), name)
+                        for name in subkey_names])
+        values = dict([(RegistryIndex.to_text(name).upper(),
+                        (name, type, RegistryIndex.to_text(data)))
+                       for (name, (type, data)) in values.items()])
+
+        digest = hashlib.sha1()
+        for upper_name in sorted(values.keys()):
+            (name, type, data) = values[upper_name]
+            # An unknown type never matches, so those keys are compared value
+            #   by value, ignoring the type
+            digest.update(upper_name.encode("utf-8") + "\0" + str(type) +
+                          "\0" + data.encode("utf-8") + "\0")
+
+        return (subkeys, values, digest.digest())
+
+    @staticmethod
+    def compare_key(path, reference, current):
+        """Compare the key at 'path' on both sides, 'reference' and 'current'
+            are what summarize() returned for them.
+
+        returns (a list of changes, the paths of the subkeys that are on both
+            sides and need comparing next)"""
+        if (reference is None and current is None):
+            return ([], [])
+        elif (reference is None):
+            return ([(RegistryDiff.ADDED, path, None, None, None)], [])
+        elif (current is None):
+            return ([(RegistryDiff.REMOVED, path, None, None, None)], [])
+
+        (reference_subkeys, reference_values, reference_digest) = reference
+        (current_subkeys, current_values, current_digest) = current
+        changes = []
+
+        if (reference_digest != current_digest):
+            for upper_name in sorted(set(reference_values.keys()) |
+                                     set(current_values.keys())):
+                old = reference_values.get(upper_name)
+                new = current_values.get(upper_name)
+                if (old is None):
+                    changes.append((RegistryDiff.ADDED, path, new[0], None,
+                                    new[2]))
+                elif (new is None):
+                    changes.append((RegistryDiff.REMOVED, path, old[0],
+                                    old[2], None))
+                elif (old[2] != new[2]):
+                    changes.append((RegistryDiff.CHANGED, path, new[0],
+                                    old[2], new[2]))
+                elif (old[1] != new[1] and
+                      old[1] is not None and new[1] is not None):
+                    # Same data, but not the same type of value
+                    changes.append((RegistryDiff.CHANGED, path, new[0],
+                                    RegistryDiff.format_typed(old[1], old[2]),
+                                    RegistryDiff.format_typed(new[1],
+                                                              new[2])))
+
+        common_paths = []
+        for upper_name in sorted(set(reference_subkeys.keys()) |
+                                 set(current_subkeys.keys())):
+            if (upper_name not in current_subkeys):
+                changes.append((RegistryDiff.REMOVED, path + "\\" +
+                                reference_subkeys[upper_name], None, None,
+                                None))
+            elif (upper_name not in reference_subkeys):
+                changes.append((RegistryDiff.ADDED, path + "\\" +
+                                current_subkeys[upper_name], None, None, None))
+            else:
+                common_paths.append(path + "\\" + current_subkeys[upper_name])
+
+        return (changes, common_paths)
+
+    @staticmethod
+    def format_typed(type, data):
+        """returns 'data' with the name of its type, for values whose type
+            changed but not their data"""
+        try:
+            type_string = RegistryValue.get_type_string(type)
+        except KeyError:
+            type_string = u"type %d" % (type)
+        return u"%s (%s)" % (data, type_string)
+
+    @staticmethod
+    def format_change(change):
+        """returns 'change' as a line of a text report"""
+        (kind, path, value_name, old, new) = change
+        symbol = {RegistryDiff.ADDED: u"+", RegistryDiff.REMOVED: u"-",
+                  RegistryDiff.CHANGED: u"*"}[kind]
+        path = RegistryIndex.to_text(path)
+
+        if (value_name is None):
+            return u"%s [%s]" % (symbol, path)
+        value_name = RegistryIndex.to_text(value_name)
+        if (kind == RegistryDiff.ADDED):
+            return u"%s [%s] %s = %s" % (symbol, path, value_name, new)
+        elif (kind == RegistryDiff.REMOVED):
+            return u"%s [%s] %s = %s" % (symbol, path, value_name, old)
+        else:
+            return u"%s [%s] %s: %s -> %s" % (symbol, path, value_name, old,
+                                              new)
+
+
+class RegFileWriter(object):
+    """Writes keys to a file one at a time, either as a standard .reg file
+        (UTF-16 text, what regedit.exe exports) or in our own compact binary
+        format.
+
+    The binary format is a header (binary_magic) followed by records:
+        'K' <uint32 length> <UTF-8 path>
+        'V' <uint32 type> <uint32 name length> <uint32 data length>
+            <UTF-8 name> <data>
+    Values belong to the last key before them. All numbers are little
+        endian."""
+
+    text_header = u"Windows Registry Editor Version 5.00"
+    binary_magic = "SGTKREG\x01"
+    binary_extension = ".regbin"
+
+    # hex: lines are wrapped to about this many characters
+    line_length = 80
+
+    def __init__(self, file, binary=False):
+        self.file = file
+        self.binary = binary
+
+        if (binary):
+            self.file.write(RegFileWriter.binary_magic)
+        else:
+            self.file.write("\xff\xfe") # UTF-16 little endian byte order mark
+            self.write_text(RegFileWriter.text_header + u"\r\n\r\n")
+
+    @staticmethod
+    def is_binary_filename(filename):
+        return filename.lower().endswith(RegFileWriter.binary_extension)
+
+    def write_text(self, text):
+        self.file.write(text.encode("utf-16-le"))
+
+    def write_key(self, path, value_list):
+        """Write the key at 'path' (an absolute path) with 'value_list',
+            a list of RegistryValues. The default value is the one with the
+            name ""."""
+        if (self.binary):
+            self.write_binary_key(path, value_list)
+            return
+
+        lines = [u"[%s]" % (RegFileWriter.to_unicode(path))]
+        for value in value_list:
+            lines.append(self.format_value(value))
+        lines.append(u"")
+        lines.append(u"")
+        self.write_text(u"\r\n".join(lines))
+
+    def write_binary_key(self, path, value_list):
+        path = RegFileWriter.to_unicode(path).encode("utf-8")
+        chunks = ["K", struct.pack("<I", len(path)), path]
+        for value in value_list:
+            name = RegFileWriter.to_unicode(value.name).encode("utf-8")
+            data = str(bytearray(value.data or []))
+            chunks.append("V")
+            chunks.append(struct.pack("<III", value.type, len(name),
+                                      len(data)))
+            chunks.append(name)
+            chunks.append(data)
+        self.file.write("".join(chunks))
+
+    @staticmethod
+    def to_unicode(string):
+        if isinstance(string, str):
+            return string.decode("utf-8", "replace")
+        return string
+
+    @staticmethod
+    def quote(string):
+        string = RegFileWriter.to_unicode(string)
+        return u'"%s"' % (string.replace(u"\\", u"\\\\").replace(u'"', u'\\"'))
+
+    def format_value(self, value):
+        """returns 'value' as a line (which may be continued) of a .reg
+            file"""
+        if (value.name == ""):
+            name = u"@"
+        else:
+            name = RegFileWriter.quote(value.name)
+        data = bytearray(value.data or [])
+
+        if (value.type == misc.REG_SZ):
+            # regedit.exe only writes strings without embedded nulls or line
+            #   breaks as text, and so do we.
+            string = RegistryValue.decode_utf16(data)
+            if (string.endswith(u"\0")):
+                string = string[:-1]
+            if (len(data) % 2 == 0 and
+                    u"\0" not in string and
+                    u"\r" not in string and u"\n" not in string):
+                return u"%s=%s" % (name, RegFileWriter.quote(string))
+        elif (value.type == misc.REG_DWORD and len(data) == 4):
+            return u"%s=dword:%08x" % (name,
+                                       RegistryValue.unpack_number("<I", data))
+
+        if (value.type == misc.REG_BINARY):
+            prefix = u"%s=hex:" % (name)
+        else:
+            prefix = u"%s=hex(%x):" % (name, value.type)
+
+        # Wrap like regedit.exe does: a trailing backslash continues the line
+        #   and continuation lines are indented by two spaces
+        lines = []
+        line = prefix
+        for index in xrange(len(data)):
+            line += u"%02x" % (data[index])
+            if (index + 1 < len(data)):
+                line += u","
+                if (len(line) >= RegFileWriter.line_length - 4):
+                    lines.append(line + u"\\")
+                    line = u"  "
+        lines.append(line)
+
+        return u"\r\n".join(lines)
+
+
+class RegFileReader(object):
+    """Reads files written by RegFileWriter or regedit.exe, one key at a time.
+
+    Iterating over a reader gives (path, value_list) for each key in the file,
+        'value_list' is a list of (name, type, data) where data is a bytearray.
+        The default value is named "".
+    Deletions in .reg files are given as None: the value_list of a key to be
+        deleted ([-path]) and the data of a value to be deleted ("name"=-).
+
+    Raises ValueError if the file isn't valid."""
+
+    def __init__(self, file):
+        self.file = file
+        magic = self.file.read(len(RegFileWriter.binary_magic))
+        self.binary = (magic == RegFileWriter.binary_magic)
+        self.file.seek(0)
+
+        if (magic.startswith("\xff\xfe")):
+            self.encoding = "utf-16"
+        else:
+            # REGEDIT4 files aren't unicode, but UTF-8 is close enough
+            self.encoding = "utf-8-sig"
+
+    def __iter__(self):
+        if (self.binary):
+            return self.read_binary()
+        else:
+            return self.read_text()
+
+    def read_exactly(self, size):
+        data = self.file.read(size)
+        if (len(data) != size):
+            raise ValueError(_("The file is truncated"))
+
+        return data
+
+    def read_binary(self):
+        self.file.read(len(RegFileWriter.binary_magic))
+        path = None
+        value_list = []
+
+        while True:
+            record_type = self.file.read(1)
+            if (record_type == "K" or record_type == ""):
+                if (path is not None):
+                    yield (path, value_list)
+                if (record_type == ""):
+                    return
+
+                (length, ) = struct.unpack("<I", self.read_exactly(4))
+                path = self.read_exactly(length).decode("utf-8")
+                value_list = []
+            elif (record_type == "V" and path is not None):
+                (type, name_length, data_length) = struct.unpack("<III",
+                                                        self.read_exactly(12))
+                name = self.read_exactly(name_length).decode("utf-8")
+                data = bytearray(self.read_exactly(data_length))
+                value_list.append((name, type, data))
+            else:
+                raise ValueError(_("Unexpected data in the file"))
+
+    def read_lines(self):
+        """Joins continued lines and skips blank lines and comments.
+
+        returns a generator of (line number, line)"""
+        reader = codecs.getreader(self.encoding)(self.file, "replace")
+        line_number = 0
+        pending = None
+
+        for line in reader:
+            line_number += 1
+            line = line.rstrip(u"\r\n")
+            if (pending is not None):
+                line = pending + line.lstrip()
+                pending = None
+            elif (line.strip() == u"" or line.startswith(u";")):
+                continue
+
+            if (line.endswith(u"\\") and not line.startswith(u"[") and
+                    u"=hex" in line):
+                pending = line[:-1]
+                continue
+
+            yield (line_number, line)
+
+        if (pending is not None):
+            yield (line_number, pending)
+
+    def read_text(self):
+        lines = self.read_lines()
+        try:
+            (line_number, header) = lines.next()
+        except StopIteration:
+            raise ValueError(_("The file is empty"))
+        if (header.strip() not in (RegFileWriter.text_header, u"REGEDIT4")):
+            raise ValueError(_("This is not a registry file"))
+
+        path = None
+        value_list = []
+        for (line_number, line) in lines:
+            line = line.strip()
+            if (line.startswith(u"[") and line.endswith(u"]")):
+                if (path is not None):
+                    yield (path, value_list)
+
+                if (line.startswith(u"[-")):
+                    yield (line[2:-1], None)
+                    path = None
+                else:
+                    path = line[1:-1]
+                    value_list = []
+            elif (path is not None):
+                try:
+                    value_list.append(RegFileReader.parse_value(line))
+                except ValueError:
+                    raise ValueError(_("Invalid value on line %d") % (
+                                                                line_number))
+            # Values after a deleted key are ignored, like regedit.exe does
+
+        if (path is not None):
+            yield (path, value_list)
+
+    @staticmethod
+    def parse_quoted(line, start):
+        """returns (the string quoted at 'start' in 'line', the index after
+            the closing quote)"""
+        if (line[start:start + 1] != u'"'):
+            raise ValueError("Expected a quote")
+
+        chars = []
+        index = start + 1
+        while index < len(line):
+            char = line[index]
+            if (char == u"\\" and index + 1 < len(line)):
+                index += 1
+                chars.append(line[index])
+            elif (char == u'"'):
+                return (u"".join(chars), index + 1)
+            else:
+                chars.append(char)
+            index += 1
+
+        raise ValueError("Unterminated string")
+
+    @staticmethod
+    def parse_value(line):
+        """returns (name, type, data) for a value line of a .reg file,
+            data is None if the value is to be deleted"""
+        if (line.startswith(u"@")):
+            name = u""
+            index = 1
+        else:
+            (name, index) = RegFileReader.parse_quoted(line, 0)
+
+        if (line[index:index + 1] != u"="):
+            raise ValueError("Expected =")
+        data = line[index + 1:].strip()
+
+        if (data == u"-"):
+            return (name, misc.REG_NONE, None)
+        elif (data.startswith(u'"')):
+            (string, end) = RegFileReader.parse_quoted(data, 0)
+            return (name, misc.REG_SZ,
+                    RegistryValue.encode_utf16(string + u"\0"))
+        elif (data.startswith(u"dword:")):
+            return (name, misc.REG_DWORD,
+                    bytearray(struct.pack("<I", int(data[6:], 16))))
+        elif (data.startswith(u"hex")):
+            (kind, hex_string) = data.split(u":", 1)
+            if (kind == u"hex"):
+                type = misc.REG_BINARY
+            elif (kind.startswith(u"hex(") and kind.endswith(u")")):
+                type = int(kind[4:-1], 16)
+            else:
+                raise ValueError("Unknown data type")
+            hex_string = hex_string.replace(u",", u"").replace(u" ", u"")
+            return (name, type, bytearray.fromhex(hex_string))
+        else:
+            raise ValueError("Unknown data type")
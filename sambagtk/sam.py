@@ -46,6 +46,12 @@ class User(object):
         self.logon_script = ""
         self.homedir_path = ""
         self.map_homedir_drive = -1
+        # Users in the user list start out with only what's shown there,
+        #   see SAMPipeManager.fetch_user_details()
+        self.details_fetched = False
+        # What the details were when they were fetched, so that only what's
+        #   changed gets sent back, see SAMPipeManager.update_user()
+        self.fetched_values = None
 
     def list_view_representation(self):
         return [self.username, self.fullname, self.description, self.rid]
@@ -379,8 +385,9 @@ class UserEditDialog(Gtk.Dialog):
             self.existing_groups_store.append([group.name])
 
         self.available_groups_store.clear()
+        user_group_rids = set([group.rid for group in self.user.group_list])
         for group in self.pipe_manager.group_list:
-            if (not group in self.user.group_list):
+            if (group.rid not in user_group_rids):
                 self.available_groups_store.append([group.name])
 
     def values_to_user(self):
@@ -416,10 +423,8 @@ class UserEditDialog(Gtk.Dialog):
         iter = self.existing_groups_store.get_iter_first()
         while (iter is not None):
             value = self.existing_groups_store.get_value(iter, 0)
-            self.user.group_list.append([group
-                                        for group in self.pipe_manager.group_list
-                                        if group.name == value
-                                        ][0])
+            self.user.group_list.append(
+                                    self.pipe_manager.groups_by_name[value])
             iter = self.existing_groups_store.iter_next(iter)
 
     def on_add_group_button_clicked(self, widget):
@@ -515,10 +520,9 @@ class GroupEditDialog(Gtk.Dialog):
             return _("Name may not be empty!")
 
         if self.brand_new:
-            for group in self.pipe_manager.group_list:
-                if group.name == self.name_entry.get_text():
-                    return _("Choose another group name, "
-                            "this one already exists!")
+            if self.name_entry.get_text() in self.pipe_manager.groups_by_name:
+                return _("Choose another group name, "
+                        "this one already exists!")
 
         return None
 